@@ -1,27 +1,81 @@
 from datetime import datetime
-from types import NoneType
+from typing import Any, Callable
 from uuid import UUID
 
-from fastapi import FastAPI, Depends, HTTPException, Query
+import orjson
+from fastapi import FastAPI, Depends, HTTPException, Path, Query, Response
+from fastapi.responses import ORJSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from analyzer.core import MarketTree
 from .descriptions import *
-from .schema import ShopUnitImportRequest
-from analyzer.db.main import add_item, add_price_for_item, delete_item, create_tables, engine, get_session
+from .schema import ShopUnitImportRequest, ShopUnitType
+from analyzer.db.main import bulk_insert_prices, bulk_upsert_items, delete_item, create_tables, engine, get_session, \
+    warm_up_pool
+
+JSON_OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z | orjson.OPT_OMIT_MICROSECONDS
+
+
+class MarketJSONResponse(ORJSONResponse):
+    """Ответ в JSON через orjson. Даты выводятся в формате 2022-02-03T12:00:00Z."""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=JSON_OPTIONS)
+
 
 tree = MarketTree()
 
 app = FastAPI(
     title="Market Open API",
     description="API для загрузки товаров в Маркет товаров",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=MarketJSONResponse
 )
 
 app.add_event_handler("startup", create_tables)
+app.add_event_handler("startup", warm_up_pool)
 app.add_event_handler("shutdown", engine.dispose)
 
 
+def uuid_int(
+        id: UUID = Path(description="Идентификатор категории / товара", example="3fa85f64-5717-4562-b3fc-2c963f66a333")
+) -> int:
+    return id.int
+
+
+# Ответы GET-запросов кэшируются уже сериализованными только для текущей версии дерева:
+# после любого изменения дерева кэш очищается, поэтому устаревшие ответы не занимают память.
+RESPONSE_CACHE_SIZE = 1024
+_response_cache: dict[tuple, bytes] = {}
+_response_cache_version = -1
+
+
+def _cached_response(key: tuple, build: Callable[[], Any]) -> bytes:
+    global _response_cache_version
+    if _response_cache_version != tree.version:
+        _response_cache.clear()
+        _response_cache_version = tree.version
+    response = _response_cache.get(key)
+    if response is None:
+        if len(_response_cache) >= RESPONSE_CACHE_SIZE:
+            _response_cache.clear()
+        response = _response_cache[key] = orjson.dumps(build(), option=JSON_OPTIONS)
+    return response
+
+
+def _nodes_response(id: int) -> bytes:
+    return _cached_response(("nodes", id), lambda: tree.get_nodes(tree.nodes[id]))
+
+
+def _sales_response(date: datetime) -> bytes:
+    return _cached_response(("sales", date), lambda: tree.get_sales(date))
+
+
+def _statistic_response(id: int, start_date: datetime | None, end_date: datetime | None) -> bytes:
+    return _cached_response(("statistic", id, start_date, end_date),
+                            lambda: tree.get_statistic_by_id(id, start_date, end_date))
+
+
 @app.post("/imports",
           tags=["Базовые запросы"],
           summary=load_items["summary"],
@@ -32,13 +86,32 @@ async def load_items(
         session: AsyncSession = Depends(get_session)
 ):
     date = request.update_date
+    batch_parents = {item.id.int: item.parent_id.int if item.parent_id else None for item in request.items}
+    if len(batch_parents) != len(request.items):
+        raise HTTPException(status_code=400, detail="Validation Failed")
+    batch_types = {item.id.int: item.type for item in request.items}
+    nodes = []
+    item_rows = []
+    price_rows = []
     for item in request.items:
-        if item.type.value == "OFFER" and isinstance(item.price, NoneType):
+        if item.type == ShopUnitType.OFFER and item.price is None:
+            raise HTTPException(status_code=400, detail="Validation Failed")
+        if item.parent_id is not None:
+            parent_type = batch_types.get(item.parent_id.int, tree.nodes.get(item.parent_id.int, {}).get("type"))
+            if parent_type != ShopUnitType.CATEGORY:
+                raise HTTPException(status_code=400, detail="Validation Failed")
+        if tree.creates_cycle(item.id.int, item.parent_id, batch_parents):
             raise HTTPException(status_code=400, detail="Validation Failed")
-        tree.add(item.dict() | {"date": date})
-        await add_item(session, item.id, item.name, item.type.value, item.parent_id)
+        nodes.append({"id": item.id, "name": item.name, "parent_id": item.parent_id, "type": item.type,
+                      "price": item.price, "date": date})
+        item_rows.append({"id": item.id, "name": item.name, "type": item.type.name, "parent_id": item.parent_id})
         if item.price:
-            await add_price_for_item(session, item.id, date, item.price)
+            price_rows.append({"id": item.id, "date": date, "price": item.price})
+
+    await bulk_upsert_items(session, item_rows)
+    await bulk_insert_prices(session, price_rows)
+    for node in nodes:
+        tree.add(node)
 
     return {"code": 200, "message": "The insertion or update was successful"}
 
@@ -49,32 +122,28 @@ async def load_items(
             description=delete_item_by_id["description"],
             responses=delete_item_by_id["responses"])
 async def delete_item_by_id(
-        id: UUID = Query(description="Идентификатор категории / товара",
-                         example="3fa85f64-5717-4562-b3fc-2c963f66a333"),
+        id: int = Depends(uuid_int),
         session: AsyncSession = Depends(get_session)
 ):
-    deleted = await delete_item(session, id)
+    deleted = await delete_item(session, UUID(int=id))
     if not deleted:
         raise HTTPException(status_code=404, detail="Item not found")
-    if id in tree.nodes[id] and tree.nodes[id]["type"].value == "OFFER":
-        tree.delete_price_by_id(id)
-    deleted = tree.delete_node_by_id(id)
-    if deleted:
-        return {"code": 200, "message": "OK"}
+    tree.delete(id)
+    return {"code": 200, "message": "OK"}
 
 
+# GET-обработчики объявлены через async def: так чтение дерева выполняется в event loop по очереди с его изменениями
+# в /imports и /delete, а не параллельно с ними в пуле потоков.
 @app.get("/nodes/{id}",
          tags=["Базовые запросы"],
          summary=get_nodes_by_id["summary"],
          description=get_nodes_by_id["description"],
          responses=get_nodes_by_id["responses"])
-def get_nodes_by_id(
-        id: UUID = Query(description="Идентификатор категории / товара", example="3fa85f64-5717-4562-b3fc-2c963f66a333")
-):
+async def get_nodes_by_id(id: int = Depends(uuid_int)):
     if id not in tree.nodes:
         raise HTTPException(status_code=404, detail="Item not found")
-    nodes = tree.get_nodes(tree.nodes[id])
-    return nodes
+    nodes = _nodes_response(id)
+    return Response(nodes, media_type=MarketJSONResponse.media_type)
 
 
 @app.get("/sales",
@@ -82,9 +151,9 @@ def get_nodes_by_id(
          summary=get_sales["summary"],
          description=get_sales["description"],
          responses=get_sales["responses"])
-def get_sales(date: datetime = Query(description="Дата и время запроса", example="2022-05-28T21:12:01.516Z")):
-    sales = tree.get_sales(date)
-    return sales
+async def get_sales(date: datetime = Query(description="Дата и время запроса", example="2022-05-28T21:12:01.516Z")):
+    sales = _sales_response(date)
+    return Response(sales, media_type=MarketJSONResponse.media_type)
 
 
 @app.get("/node/{id}/statistic",
@@ -92,9 +161,8 @@ def get_sales(date: datetime = Query(description="Дата и время зап
          summary=get_statistic_by_id["summary"],
          description=get_statistic_by_id["description"],
          responses=get_statistic_by_id["responses"])
-def get_statistic_by_id(
-        id: UUID = Query(description="UUID товара / категории, для которой будет отображаться статистика",
-                         example="2022-05-28T21:12:01.516Z"),
+async def get_statistic_by_id(
+        id: int = Depends(uuid_int),
         dateStart: datetime = Query(default=None,
                                     description="Дата и время начала интервала, для которого считается статистика",
                                     example="2022-05-28T21:12:01.516Z"),
@@ -105,5 +173,5 @@ def get_statistic_by_id(
         raise HTTPException(status_code=400, detail="Validation Failed")
     if id not in tree.nodes:
         raise HTTPException(status_code=404, detail="Item not found")
-    statistic = tree.get_statistic_by_id(id, dateStart, dateEnd)
-    return statistic
+    statistic = _statistic_response(id, dateStart, dateEnd)
+    return Response(statistic, media_type=MarketJSONResponse.media_type)
@@ -1,13 +1,31 @@
-from enum import Enum
+from enum import IntEnum
 from typing import Optional
 from uuid import UUID
 from datetime import datetime
 from pydantic import BaseModel, Field
 
 
-class ShopUnitType(str, Enum):
-    offer = "OFFER"
-    category = "CATEGORY"
+class ShopUnitType(IntEnum):
+    """Тип элемента. Хранится как целое число, а в JSON принимается и выводится по имени: OFFER / CATEGORY."""
+    OFFER = 0
+    CATEGORY = 1
+
+    @classmethod
+    def __get_validators__(cls):
+        yield cls.validate
+
+    @classmethod
+    def validate(cls, value):
+        if isinstance(value, cls):
+            return value
+        try:
+            return cls[value]
+        except KeyError:
+            raise ValueError(f"value is not a valid enumeration member; permitted: {', '.join(cls.__members__)}")
+
+    @classmethod
+    def __modify_schema__(cls, field_schema):
+        field_schema.update(type="string", enum=list(cls.__members__))
 
 
 class ShopUnitImport(BaseModel):
@@ -1,18 +1,60 @@
-from datetime import datetime
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+from datetime import datetime, timedelta
+from operator import itemgetter
+from typing import Any, Final, overload
 from uuid import UUID
 
+from sortedcontainers import SortedKeyList  # type: ignore[import-untyped]
+
+# Значения совпадают с analyzer.api.schema.ShopUnitType (IntEnum), поэтому тип узла сравнивается как целое число.
+_OFFER: Final = 0
+_CATEGORY: Final = 1
+_TYPE_NAMES: Final = ("OFFER", "CATEGORY")
+
+
+@overload
+def _key(id: UUID | int | str) -> int: ...
+
+
+@overload
+def _key(id: None) -> None: ...
+
+
+def _key(id: UUID | int | str | None) -> int | None:
+    """Преобразование идентификатора товара / категории в ключ словарей дерева (UUID.int).
+
+    Parameters:
+        id (UUID | int | str | NoneType):
+            Уникальный идентификатор товара / категории или уже готовый ключ.
+
+    Returns:
+        key (int | NoneType):
+            Целочисленное представление UUID.
+    """
+    if id is None or isinstance(id, int):
+        return id
+    if isinstance(id, UUID):
+        return id.int
+    return UUID(id).int
+
 
 class MarketTree:
 
-    def __init__(self):
-        self.nodes = {}
-        self.price_by_id = {}
+    def __init__(self) -> None:
+        self.nodes: dict[int, dict[str, Any]] = {}
+        self.price_by_id: dict[int, list[tuple[datetime, int]]] = {}
+        self.sales_index: SortedKeyList = SortedKeyList(key=itemgetter(0))
+        self.children_by_parent: defaultdict[int | None, list[int]] = defaultdict(list)
+        self._agg_cache: dict[int, tuple[int, int, datetime]] = {}
+        self._agg_dirty: set[int] = set()
+        self.version: int = 0
 
-    def add_price(self, id: UUID, date: datetime, price: int):
-        """Добавление цены товара в словарик по ID товара.
+    def add_price(self, id: UUID | int, date: datetime, price: int) -> None:
+        """Добавление цены товара в словарик по ID товара. История цен хранится отсортированной по дате.
 
         Parameters:
-            id (UUID):
+            id (UUID | int):
                 Уникальный идентификатор товара.
             date (datetime):
                 Время обновления цены товара.
@@ -22,24 +64,30 @@ class MarketTree:
         Returns:
             None
         """
+        id = _key(id)
         if id not in self.price_by_id:
             self.price_by_id[id] = [(date, price)]
         else:
-            self.price_by_id[id].append((date, price))
+            insort(self.price_by_id[id], (date, price), key=itemgetter(0))
+        self.sales_index.add((date, id, price))
+        self.version += 1
 
-    def delete_price_by_id(self, id: UUID):
+    def delete_price_by_id(self, id: UUID | int) -> None:
         """Удаление истории стоимости товара по ID товара.
 
         Parameters:
-            id (UUID):
+            id (UUID | int):
                 Уникальный идентификатор товара.
 
         Returns:
             None
         """
-        del self.price_by_id[id]
+        id = _key(id)
+        for date, price in self.price_by_id.pop(id):
+            self.sales_index.remove((date, id, price))
+        self.version += 1
 
-    def add(self, node: dict) -> None:
+    def add(self, node: dict[str, Any]) -> None:
         """Добавление товара / категории в дерево Маркета.
 
         Parameters:
@@ -49,121 +97,198 @@ class MarketTree:
         Returns:
             None
         """
-        id = node["id"]
-        parent_id = node["parent_id"]
-
-        child = [] if node["type"].value == "CATEGORY" else None
-        self.nodes[id] = node | {"children": self.nodes.get(id, {}).get("children", child)}
+        id = _key(node["id"])
+        parent_id = _key(node["parent_id"])
+
+        previous = self.nodes.get(id)
+        if previous is None or previous["parent_id"] != node["parent_id"]:
+            if previous is not None:
+                previous_parent_id = _key(previous["parent_id"])
+                siblings = self.children_by_parent.get(previous_parent_id)
+                if siblings is not None and id in siblings:
+                    siblings.remove(id)
+                self._invalidate(previous_parent_id)
+            self.children_by_parent[parent_id].append(id)
+
+        children = self.children_by_parent[id] if node["type"] == _CATEGORY else None
+        self.nodes[id] = node | {"children": children}
+        if children is not None:
+            self._agg_dirty.add(id)
+        self._invalidate(parent_id)
+        self.version += 1
 
         if node["price"]:
             self.add_price(id, node["date"], node["price"])
-        elif node["type"].value == "CATEGORY":
-            for node_id, node_info in self.nodes.items():
-                if node_info["parent_id"] == id and node_id not in self.nodes[id]["children"]:
-                    self.nodes[id]["children"].append(node_id)
 
-        if parent_id in self.nodes and id not in self.nodes[parent_id]["children"]:
-            self.nodes[parent_id]["children"].append(id)
+    def delete(self, id: UUID | int) -> dict[str, Any] | None:
+        """Удаление товара / категории по ID вместе со всеми потомками и их историей цен.
 
-    def delete_node_by_id(self, id: UUID) -> dict | None:
-        """Удаление товара / категории по ID. При удалении категории удаляются все дети данной категории.
+        Parameters:
+            id (UUID | int):
+                Уникальный идентификатор товара / категории.
+
+        Returns:
+            node (dict | NoneType):
+                Информация об удалённом элементе. Если данного элемента нет в Маркете, то вернётся None.
+        """
+        id = _key(id)
+        if id not in self.nodes:
+            return None
+
+        stack = [id]
+        while stack:
+            node_id = stack.pop()
+            children = self.children_by_parent.pop(node_id, None)
+            if children:
+                stack.extend(children)
+            if node_id in self.price_by_id:
+                self.delete_price_by_id(node_id)
+            if node_id != id:
+                self._agg_cache.pop(node_id, None)
+                self._agg_dirty.discard(node_id)
+                del self.nodes[node_id]
+
+        return self.delete_node_by_id(id)
+
+    def delete_node_by_id(self, id: UUID | int) -> dict[str, Any] | None:
+        """Удаление товара / категории по ID без потомков и истории цен.
 
         Parameters:
-            id (UUID):
+            id (UUID | int):
                 Уникальный идентификатор товара / категории.
 
         Returns:
             node (dict | NoneType):
                 Информация об удалённом элементе. Если данного элемента нет в Маркете, то вернётся None.
         """
+        id = _key(id)
         if id in self.nodes:
             node = self.nodes[id]
-            parent_id = node["parent_id"]
-            if parent_id and parent_id in self.nodes:
-                self.nodes[parent_id]["children"].remove(id)
+            parent_id = _key(node["parent_id"])
+            siblings = self.children_by_parent.get(parent_id)
+            if siblings is not None and id in siblings:
+                siblings.remove(id)
+            self.children_by_parent.pop(id, None)
+            self._invalidate(parent_id)
+            self._agg_cache.pop(id, None)
+            self._agg_dirty.discard(id)
             del self.nodes[id]
+            self.version += 1
             return node
+        return None
 
-    def show(self, id: UUID, level=0) -> None:
-        """Метод для вывода в консоль визуального представления товаров / категорий по ID.
+    def _invalidate(self, id: int | None) -> None:
+        """Пометка категории и всех её предков как требующих пересчёта общей цены, количества товаров и даты.
 
         Parameters:
-            id (UUID):
-                Уникальный идентификатор товара / категории.
-            level (int):
-                Уровень в каталоге.
+            id (int | NoneType):
+                Ключ товара / категории, с которого начинается подъём по дереву.
 
         Returns:
             None
         """
-        children = self.nodes[id]["children"]
-        print("  " * level, f"{self.nodes[id]['name']} (id={id})")
-        level += 1
+        while id in self.nodes and id not in self._agg_dirty:
+            if self.nodes[id]["children"] is not None:
+                self._agg_dirty.add(id)
+            id = _key(self.nodes[id]["parent_id"])
 
-        for node in children:
-            self.show(node["id"], level)
-
-    def calculate_price_for_category(self, id: UUID) -> tuple[int, int]:
-        """Метод для вычисления общей цены и количества товаров в категории по ID категории.
+    def creates_cycle(self, id: UUID | int, parent_id: UUID | int | None,
+                      pending_parents: dict[int, int | None] | None = None) -> bool:
+        """Проверка, станет ли товар / категория своим же предком после переноса в родителя parent_id.
 
         Parameters:
-            id (UUID):
-                Уникальный идентификатор категории.
+            id (UUID | int):
+                Уникальный идентификатор товара / категории.
+            parent_id (UUID | int | NoneType):
+                Уникальный идентификатор нового родителя.
+            pending_parents (dict | NoneType):
+                Родители ещё не добавленных в дерево элементов (например, из текущего импорта).
+                Имеют приоритет над родителями из дерева.
 
         Returns:
-            amount, price (tuple):
-                Кортеж из общей цены в категории и количество товаров в ней.
+            cycle (bool):
+                True, если подъём от parent_id по родителям приходит к самому элементу.
         """
-        amount = 0
-        count_items = 0
-        for node_id in self.nodes[id]["children"]:
-            if self.nodes[node_id]["type"].value == "OFFER":
-                amount += self.nodes[node_id]["price"]
-                count_items += 1
-            elif self.nodes[node_id]["type"].value == "CATEGORY":
-                a, c = self.calculate_price_for_category(node_id)
-                amount += a
-                count_items += c
-        return amount, count_items
-
-    def calculate_date_for_category(self, id: UUID) -> datetime:
-        """Метод для вычисления последней даты обновления товаров / категорий в конкретной категории по ID.
+        id = _key(id)
+        pending_parents = pending_parents or {}
+        ancestor_id = _key(parent_id)
+        seen: set[int] = set()
+        while ancestor_id is not None and ancestor_id not in seen:
+            if ancestor_id == id:
+                return True
+            seen.add(ancestor_id)
+            if ancestor_id in pending_parents:
+                ancestor_id = pending_parents[ancestor_id]
+            elif ancestor_id in self.nodes:
+                ancestor_id = _key(self.nodes[ancestor_id]["parent_id"])
+            else:
+                ancestor_id = None
+        return False
+
+    def show(self, id: UUID | int, level: int = 0) -> None:
+        """Метод для вывода в консоль визуального представления товаров / категорий по ID.
 
         Parameters:
-            id (UUID):
-                Уникальный идентификатор категории.
+            id (UUID | int):
+                Уникальный идентификатор товара / категории.
+            level (int):
+                Уровень в каталоге.
 
         Returns:
-            date (datetime):
-                Дата последнего обновления.
+            None
         """
-        date = self.nodes[id]["date"]
-        for node_id in self.nodes[id]["children"]:
-            if self.nodes[node_id]["type"].value == "OFFER":
-                if self.nodes[node_id]["date"] > date:
-                    date = self.nodes[node_id]["date"]
-            elif self.nodes[node_id]["type"].value == "CATEGORY":
-                new_date = self.calculate_date_for_category(node_id)
-                if new_date > date:
-                    date = new_date
-        return date
-
-    @staticmethod
-    def convert_date(date: datetime) -> str:
-        """Конвертация даты в определённый формат.
-        Пример конвертации: 2022-02-03T12:00:00+00:00 -> 2022-02-03T12:00:00Z.
+        stack = [(_key(id), level)]
+        while stack:
+            node_id, level = stack.pop()
+            node = self.nodes[node_id]
+            print("  " * level, f"{node['name']} (id={node['id']})")
+            if node["children"]:
+                stack.extend((child_id, level + 1) for child_id in reversed(node["children"]))
+
+    def calculate_aggregates_for_category(self, id: UUID | int) -> tuple[int, int, datetime]:
+        """Метод для вычисления общей цены, количества товаров и последней даты обновления в категории по ID.
+        Результат кэшируется и пересчитывается только после изменений внутри категории.
 
         Parameters:
-            date (datetime):
-                Время обновления товара / категории.
+            id (UUID | int):
+                Уникальный идентификатор категории.
 
         Returns:
-            date (str):
-                Дата в необходимом формате.
+            amount, count_items, date (tuple):
+                Кортеж из общей цены в категории, количества товаров в ней и даты последнего обновления.
         """
-        return date.strftime("%Y-%m-%dT%H:%M:%SZ")
-
-    def get_nodes(self, node: dict) -> dict:
+        id = _key(id)
+        stack = [id]
+        order: list[int] = []
+        while stack:
+            category_id = stack.pop()
+            if category_id in self._agg_dirty or category_id not in self._agg_cache:
+                order.append(category_id)
+                stack.extend(node_id for node_id in self.nodes[category_id]["children"]
+                             if self.nodes[node_id]["type"] == _CATEGORY)
+
+        for category_id in reversed(order):
+            amount = 0
+            count_items = 0
+            date = self.nodes[category_id]["date"]
+            for node_id in self.nodes[category_id]["children"]:
+                child = self.nodes[node_id]
+                if child["type"] == _OFFER:
+                    amount += child["price"]
+                    count_items += 1
+                    child_date = child["date"]
+                else:
+                    a, c, child_date = self._agg_cache[node_id]
+                    amount += a
+                    count_items += c
+                if child_date > date:
+                    date = child_date
+            self._agg_cache[category_id] = amount, count_items, date
+            self._agg_dirty.discard(category_id)
+
+        return self._agg_cache[id]
+
+    def get_nodes(self, node: dict[str, Any]) -> dict[str, Any]:
         """Вывод информации о всех товарах и / или категориях в категории (либо информации о товаре).
 
         Parameters:
@@ -174,17 +299,47 @@ class MarketTree:
             nodes (dict):
                 Результирующий словарь с информацией о товаре / категории и всех их потомках.
         """
-        date = self.convert_date(node["date"])
-        result_node = {"date": date, "id": node["id"], "name": node["name"], "parentId": node["parent_id"],
-                       "type": node["type"]}
-        if node["children"] is not None:
-            amount, count = self.calculate_price_for_category(node["id"])
-            return result_node | {"children": [self.get_nodes(self.nodes[id]) for id in sorted(node["children"])]} | \
-                   {"price": amount // count, "date": self.convert_date(self.calculate_date_for_category(node["id"]))}
-        else:
-            return result_node | {"price": node["price"], "children": node["children"]}
-
-    def get_sales(self, date: datetime) -> dict:
+        root_id = _key(node["id"])
+        stack = [root_id]
+        order: list[int] = []
+        while stack:
+            node_id = stack.pop()
+            order.append(node_id)
+            if self.nodes[node_id]["children"]:
+                stack.extend(self.nodes[node_id]["children"])
+
+        built: dict[int, dict[str, Any]] = {}
+        totals: dict[int, tuple[int, int, datetime]] = {}
+        for node_id in reversed(order):
+            node = self.nodes[node_id]
+            if node["children"] is None:
+                totals[node_id] = node["price"], 1, node["date"]
+                built[node_id] = {"date": node["date"], "id": node["id"], "name": node["name"],
+                                  "parentId": node["parent_id"], "type": _TYPE_NAMES[node["type"]], "price": node["price"],
+                                  "children": None}
+                continue
+
+            if node_id in self._agg_dirty or node_id not in self._agg_cache:
+                amount = 0
+                count = 0
+                date = node["date"]
+                for child_id in node["children"]:
+                    a, c, child_date = totals[child_id]
+                    amount += a
+                    count += c
+                    if child_date > date:
+                        date = child_date
+                self._agg_cache[node_id] = amount, count, date
+                self._agg_dirty.discard(node_id)
+
+            amount, count, date = totals[node_id] = self._agg_cache[node_id]
+            built[node_id] = {"date": date, "id": node["id"], "name": node["name"],
+                              "parentId": node["parent_id"], "type": _TYPE_NAMES[node["type"]],
+                              "children": [built.pop(id) for id in sorted(node["children"])],
+                              "price": amount // count if count else None}
+        return built[root_id]
+
+    def get_sales(self, date: datetime) -> dict[str, list[dict[str, Any]]]:
         """Получение списка товаров, цена которых была обновлена за последние 24 часа от времени переданном в запросе.
         Обновление цены не означает её изменение. Обновления цен удаленных товаров недоступны.
 
@@ -196,35 +351,34 @@ class MarketTree:
             sales (dict):
                 Результирующий словарь со списком товаров, цена которых была обновлена за последние 24 часа от date.
         """
-        sales = {"items": []}
-
-        for id in self.price_by_id:
-            self.price_by_id[id].sort(key=lambda date_and_price: date_and_price[0], reverse=True)
-            for node_date, node_price in self.price_by_id[id]:
-                difference = date - node_date
-                if difference.days <= 1:
-                    node = self.nodes[id]
-                    result_node = {
-                        "id": node["id"],
-                        "name": node["name"],
-                        "date": self.convert_date(node_date),
-                        "parentId": node["parent_id"],
-                        "price": node_price,
-                        "type": node["type"].value
-                    }
-                    sales["items"].append(result_node)
-                    break
+        sales: dict[str, list[dict[str, Any]]] = {"items": []}
+        seen = set()
+
+        for node_date, id, node_price in self.sales_index.irange_key(date - timedelta(days=1), date, reverse=True):
+            if id not in seen:
+                seen.add(id)
+                node = self.nodes[id]
+                result_node = {
+                    "id": node["id"],
+                    "name": node["name"],
+                    "date": node_date,
+                    "parentId": node["parent_id"],
+                    "price": node_price,
+                    "type": _TYPE_NAMES[node["type"]]
+                }
+                sales["items"].append(result_node)
 
         return sales
 
-    def get_statistic_by_id(self, id: UUID, start_date: datetime = None, end_date: datetime = None) -> dict:
+    def get_statistic_by_id(self, id: UUID | int, start_date: datetime | None = None,
+                            end_date: datetime | None = None) -> dict[str, list[dict[str, Any]]]:
         """Получение статистики (истории обновлений) по цене товара/категории за заданный интервал.
         Статистика по удаленным элементам недоступна. Цена категории - это средняя цена всех её товаров,
         включая товары дочерних категорий. Если категория не содержит товаров цена равна null.
         Можно получить статистику за всё время.
 
         Parameters:
-            id (UUID):
+            id (UUID | int):
                 Уникальный идентификатор товара / категории.
 
             start_date (datetime | NoneType):
@@ -237,57 +391,41 @@ class MarketTree:
             statistic (dict):
                 Результирующий словарь со статистикой (истории обновления) по цене.
         """
-        statistic = {"items": []}
-
-        if self.nodes[id]["type"].value == "OFFER":
-            self.price_by_id[id].sort(key=lambda date_and_price: date_and_price[0], reverse=False)
-            for node_date, node_price in self.price_by_id[id]:
-                result_date = None
-                if start_date and end_date and start_date <= node_date <= end_date:
-                    result_date = node_date
-                elif start_date and end_date is None and start_date <= node_date:
-                    result_date = node_date
-                elif end_date and start_date is None and node_date <= end_date:
-                    result_date = node_date
-                elif start_date is None and end_date is None:
-                    result_date = node_date
-
-                if result_date:
-                    result_node = {
-                        "id": id,
-                        "name": self.nodes[id]["name"],
-                        "date": result_date,
-                        "parentId": self.nodes[id]["parent_id"],
-                        "price": node_price,
-                        "type": self.nodes[id]["type"]
-                    }
-                    statistic["items"].append(result_node)
-        elif self.nodes[id]["type"].value == "CATEGORY":
-            node_date = self.calculate_date_for_category(id)
-            amount, count_items = self.calculate_price_for_category(id)
+        statistic: dict[str, list[dict[str, Any]]] = {"items": []}
+        id = _key(id)
+        tzinfo = self.nodes[id]["date"].tzinfo
+        start_date = start_date or datetime.min.replace(tzinfo=tzinfo)
+        end_date = end_date or datetime.max.replace(tzinfo=tzinfo)
+
+        if self.nodes[id]["type"] == _OFFER:
+            history = self.price_by_id[id]
+            first = bisect_left(history, start_date, key=itemgetter(0))
+            last = bisect_right(history, end_date, key=itemgetter(0))
+            for node_date, node_price in history[first:last]:
+                result_node = {
+                    "id": self.nodes[id]["id"],
+                    "name": self.nodes[id]["name"],
+                    "date": node_date,
+                    "parentId": self.nodes[id]["parent_id"],
+                    "price": node_price,
+                    "type": _TYPE_NAMES[self.nodes[id]["type"]]
+                }
+                statistic["items"].append(result_node)
+        elif self.nodes[id]["type"] == _CATEGORY:
+            amount, count_items, node_date = self.calculate_aggregates_for_category(id)
             if count_items == 0:
                 node_price = None
             else:
                 node_price = amount // count_items
 
-            result_date = None
-            if start_date and end_date and start_date <= node_date <= end_date:
-                result_date = node_date
-            elif start_date and end_date is None and start_date <= node_date:
-                result_date = node_date
-            elif end_date and start_date is None and node_date <= end_date:
-                result_date = node_date
-            elif start_date is None and end_date is None:
-                result_date = node_date
-
-            if result_date:
+            if start_date <= node_date <= end_date:
                 result_node = {
-                    "id": id,
+                    "id": self.nodes[id]["id"],
                     "name": self.nodes[id]["name"],
-                    "date": result_date,
+                    "date": node_date,
                     "parentId": self.nodes[id]["parent_id"],
                     "price": node_price,
-                    "type": self.nodes[id]["type"]
+                    "type": _TYPE_NAMES[self.nodes[id]["type"]]
                 }
                 statistic["items"].append(result_node)
 
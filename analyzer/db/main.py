@@ -1,9 +1,11 @@
+import asyncio
 import asyncpg
-from datetime import datetime
-from sqlalchemy import select, update
+from sqlalchemy import delete, insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 from analyzer.db.schema import Item, Price, Base
 
@@ -11,7 +13,11 @@ from settings import config
 
 engine = create_async_engine(
     f"postgresql+asyncpg://{config.POSTGRES_USER}:{config.POSTGRES_PASSWORD}@{config.POSTGRES_HOST}:{config.POSTGRES_PORT}/{config.POSTGRES_DB}",
-    echo=True
+    echo=config.DEBUG,
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=config.POSTGRES_POOL_SIZE,
+    max_overflow=config.POSTGRES_MAX_OVERFLOW,
+    pool_recycle=3600
 )
 
 
@@ -22,93 +28,65 @@ async def create_tables():
         await conn.run_sync(Base.metadata.create_all)
 
 
+async def warm_up_pool():
+    """Функция для заполнения пула соединений с БД при старте приложения."""
+    connections = await asyncio.gather(*(engine.connect() for _ in range(config.POSTGRES_POOL_SIZE)))
+    await asyncio.gather(*(connection.close() for connection in connections))
+
+
+# asyncpg принимает не больше 32767 параметров в одном запросе, а на каждый товар в upsert приходится 4 параметра.
+UPSERT_CHUNK_SIZE = 5000
+
 async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
 
 async def get_session() -> AsyncSession:
     """Yield db session."""
     async with async_session() as session:
-        yield session
-        await session.commit()
-
-
-async def update_item(session: AsyncSession, id: UUID, name: str, type_item: str, parent_id: UUID = None):
-    """Обновление товара / категории в БД.
-
-    Parameters:
-        session (AsyncSession):
-            Сессия в БД.
-        id (UUID):
-            Уникальный идентификатор товара / категории.
-        name (str):
-            Название товара / категории.
-        type_item (str):
-            Тип: Товар или категория.
-        parent_id (UUID):
-            ID родителя товара / категории.
-
-    Returns:
-        result (sqlalchemy.engine.cursor.CursorResult):
-            Добавленный элемент.
-    """
-    item_update = update(Item).values(
-        {"name": name, "type": type_item, "parent_id": parent_id}
-    ).where(Item.id == id).execution_options(synchronize_session="fetch")
-    res = await session.execute(item_update)
-    return res
+        try:
+            yield session
+            await session.commit()
+        except Exception:
+            await session.rollback()
+            raise
 
 
-async def add_item(session: AsyncSession, id, name: str, type_item: str, parent_id: UUID = None):
-    """Добавление товара / категории в БД.
+async def bulk_upsert_items(session: AsyncSession, rows: list[dict]):
+    """Добавление или обновление товаров / категорий в БД запросами по UPSERT_CHUNK_SIZE строк.
 
     Parameters:
         session (AsyncSession):
             Сессия в БД.
-        id (UUID):
-            Уникальный идентификатор товара / категории.
-        name (str):
-            Название товара / категории.
-        type_item (str):
-            Тип: Товар или категория.
-        parent_id (UUID):
-            ID родителя товара / категории.
+        rows (list[dict]):
+            Список словарей с ключами id, name, type и parent_id.
 
     Returns:
-        result (sqlalchemy.engine.cursor.CursorResult):
-            Добавленный элемент.
+        None
     """
-    item_row = await session.execute(select(Item).filter_by(id=id))
-    if item_row.first():
-        return await update_item(session, id, name, type_item, parent_id)
-    else:
-        if parent_id != "None":
-            new_item = Item(id=id, name=name, type=type_item, parent_id=parent_id)
-        else:
-            new_item = Item(id=id, name=name, type=type_item)
-        session.add(new_item)
-        return new_item
+    for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+        stmt = pg_insert(Item).values(rows[start:start + UPSERT_CHUNK_SIZE])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Item.id],
+            set_={"name": stmt.excluded.name, "type": stmt.excluded.type, "parent_id": stmt.excluded.parent_id}
+        )
+        await session.execute(stmt)
 
 
-async def add_price_for_item(session: AsyncSession, id: UUID, date: datetime, price: int):
-    """Добавление даты и цены при обновлении товара в БД.
+async def bulk_insert_prices(session: AsyncSession, rows: list[dict]):
+    """Добавление дат и цен для нескольких товаров в БД одним запросом.
 
     Parameters:
         session (AsyncSession):
             Сессия в БД.
-        id (UUID):
-            Уникальный идентификатор товара.
-        date (datetime):
-            Время обновления цены товара.
-        price (int):
-            Стоимость товара.
+        rows (list[dict]):
+            Список словарей с ключами id, date и price.
 
     Returns:
-        result (Price):
-            Добавленный элемент.
+        None
     """
-    new_price = Price(id=id, date=date, price=price)
-    session.add(new_price)
-    return new_price
+    if not rows:
+        return
+    await session.execute(insert(Price), rows)
 
 
 async def delete_all_prices(session: AsyncSession, id: UUID):
@@ -123,12 +101,7 @@ async def delete_all_prices(session: AsyncSession, id: UUID):
     Returns:
         None
     """
-    item_row = await session.execute(select(Price).filter(Price.id == id))
-    item_rows = item_row.scalars().fetchall()
-    if item_rows:
-        for item_row in item_rows:
-            await session.delete(item_row)
-            await session.commit()
+    await session.execute(delete(Price).where(Price.id == id))
 
 
 async def delete_item(session: AsyncSession, id: UUID):
@@ -141,13 +114,9 @@ async def delete_item(session: AsyncSession, id: UUID):
             Уникальный идентификатор товара.
 
     Returns:
-        item_row (Item):
-            Удалённый элемент.
+        id (UUID | NoneType):
+            ID удалённого элемента. Если элемента нет в БД, то вернётся None.
     """
     await delete_all_prices(session, id)
-    item_row = await session.execute(select(Item).filter(Item.id == id))
-    item_row = item_row.scalars().fetchall()
-    if item_row:
-        await session.delete(item_row[0])
-        await session.commit()
-        return item_row[0]
+    result = await session.execute(delete(Item).where(Item.id == id).returning(Item.id))
+    return result.scalar_one_or_none()
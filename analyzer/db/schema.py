@@ -1,4 +1,4 @@
-from sqlalchemy import Column, DateTime, ForeignKey, Integer, Text
+from sqlalchemy import Column, DateTime, ForeignKey, Index, Integer, Text
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import relationship
@@ -10,7 +10,11 @@ class Item(Base):
     __tablename__ = "Item"
     id = Column(UUID(as_uuid=True), nullable=False, primary_key=True)
     name = Column(Text, nullable=False)
-    parent_id = Column(UUID(as_uuid=True), nullable=True)
+    # Проверка родителя откладывается до конца транзакции: импорт разбивается на несколько запросов,
+    # и родитель может оказаться в более позднем из них.
+    parent_id = Column(UUID(as_uuid=True),
+                       ForeignKey("Item.id", ondelete="CASCADE", deferrable=True, initially="DEFERRED"),
+                       nullable=True, index=True)
     type = Column(Text, nullable=False)
 
     __mapper_args__ = {"eager_defaults": True}
@@ -20,8 +24,9 @@ class Price(Base):
     __tablename__ = "Price"
     index = Column(Integer, primary_key=True, autoincrement=True)
 
-    id = Column(UUID(as_uuid=True), ForeignKey("Item.id"), nullable=False)
+    id = Column(UUID(as_uuid=True), ForeignKey("Item.id", ondelete="CASCADE"), nullable=False)
     date = Column(DateTime(timezone=True), nullable=False)
     price = Column(Integer, nullable=False)
     bs = relationship("Item", foreign_keys=[id])
+    __table_args__ = (Index("ix_price_id_date", id, date.desc()),)
     __mapper_args__ = {"eager_defaults": True}
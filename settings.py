@@ -4,12 +4,15 @@ from pydantic import BaseSettings
 class Settings(BaseSettings):
     UVICORN_HOST: str
     UVICORN_PORT: int
+    DEBUG: bool = False
 
     POSTGRES_USER: str
     POSTGRES_PASSWORD: str
     POSTGRES_DB: str
     POSTGRES_HOST: str
     POSTGRES_PORT: int
+    POSTGRES_POOL_SIZE: int = 20
+    POSTGRES_MAX_OVERFLOW: int = 10
 
     class Config:
         env_file = '.env'
@@ -3,6 +3,13 @@ from setuptools import setup, find_packages
 with open("requirements.txt") as file:
     required = file.read().splitlines()
 
+try:
+    from mypyc.build import mypycify
+except ImportError:
+    ext_modules = []
+else:
+    ext_modules = mypycify(["analyzer/core/tree.py"])
+
 setup(
     name="analyzer",
     version="1.0.0",
@@ -12,4 +19,5 @@ setup(
     packages=find_packages(exclude=['tests']),
     install_requires=required,
     include_package_data=True,
+    ext_modules=ext_modules,
 )
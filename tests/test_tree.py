@@ -0,0 +1,131 @@
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+
+from analyzer.api.schema import ShopUnitType
+from analyzer.core import MarketTree
+
+DATE = datetime(2022, 2, 1, 12, tzinfo=timezone.utc)
+
+
+def add(tree, id, parent_id, type, price=None, date=DATE):
+    tree.add({"id": id, "name": str(id), "parent_id": parent_id, "type": type, "price": price, "date": date})
+
+
+def price_and_date(tree, id):
+    node = tree.get_nodes(tree.nodes[id.int])
+    statistic = tree.get_statistic_by_id(id)["items"][0]
+    assert (statistic["price"], statistic["date"]) == (node["price"], node["date"])
+    return node["price"], node["date"]
+
+
+def test_add_offer_invalidates_ancestors():
+    tree = MarketTree()
+    root, category, first, second = uuid4(), uuid4(), uuid4(), uuid4()
+    add(tree, root, None, ShopUnitType.CATEGORY)
+    add(tree, category, root, ShopUnitType.CATEGORY)
+    add(tree, first, category, ShopUnitType.OFFER, 100)
+    assert price_and_date(tree, root) == (100, DATE)
+
+    later = DATE + timedelta(hours=1)
+    add(tree, second, category, ShopUnitType.OFFER, 300, later)
+    assert price_and_date(tree, root) == (200, later)
+    assert price_and_date(tree, category) == (200, later)
+
+
+def test_reparent_dirty_category_invalidates_new_parent():
+    tree = MarketTree()
+    a, b, x, first, second = uuid4(), uuid4(), uuid4(), uuid4(), uuid4()
+    add(tree, a, None, ShopUnitType.CATEGORY)
+    add(tree, b, None, ShopUnitType.CATEGORY)
+    add(tree, x, a, ShopUnitType.CATEGORY)
+    add(tree, first, x, ShopUnitType.OFFER, 100)
+    assert price_and_date(tree, b) == (None, DATE)
+
+    later = DATE + timedelta(hours=1)
+    add(tree, second, x, ShopUnitType.OFFER, 300, later)
+    add(tree, x, b, ShopUnitType.CATEGORY, date=later)
+    assert price_and_date(tree, b) == (200, later)
+    assert price_and_date(tree, a) == (None, DATE)
+
+
+def test_reparent_offer_invalidates_both_parents():
+    tree = MarketTree()
+    a, b, offer = uuid4(), uuid4(), uuid4()
+    add(tree, a, None, ShopUnitType.CATEGORY)
+    add(tree, b, None, ShopUnitType.CATEGORY)
+    add(tree, offer, a, ShopUnitType.OFFER, 100)
+    assert price_and_date(tree, a) == (100, DATE)
+    assert price_and_date(tree, b) == (None, DATE)
+
+    add(tree, offer, b, ShopUnitType.OFFER, 100)
+    assert price_and_date(tree, a) == (None, DATE)
+    assert price_and_date(tree, b) == (100, DATE)
+
+
+def test_delete_invalidates_ancestors():
+    tree = MarketTree()
+    root, category, first, second = uuid4(), uuid4(), uuid4(), uuid4()
+    add(tree, root, None, ShopUnitType.CATEGORY)
+    add(tree, category, root, ShopUnitType.CATEGORY)
+    add(tree, first, root, ShopUnitType.OFFER, 100)
+    add(tree, second, category, ShopUnitType.OFFER, 300)
+    assert price_and_date(tree, root) == (200, DATE)
+
+    tree.delete(category)
+    assert price_and_date(tree, root) == (100, DATE)
+    assert second.int not in tree.nodes
+    assert second.int not in tree.price_by_id
+    assert [item["id"] for item in tree.get_sales(DATE)["items"]] == [first]
+
+    tree.delete(first)
+    assert price_and_date(tree, root) == (None, DATE)
+
+
+def test_creates_cycle():
+    tree = MarketTree()
+    root, category, offer = uuid4(), uuid4(), uuid4()
+    add(tree, root, None, ShopUnitType.CATEGORY)
+    add(tree, category, root, ShopUnitType.CATEGORY)
+    add(tree, offer, category, ShopUnitType.OFFER, 100)
+
+    assert tree.creates_cycle(root, root)
+    assert tree.creates_cycle(root, category)
+    assert not tree.creates_cycle(category, None)
+    assert not tree.creates_cycle(offer, root)
+
+    new = uuid4()
+    assert tree.creates_cycle(new, root, {new.int: None, root.int: new.int})
+    assert not tree.creates_cycle(root, category, {category.int: None})
+
+
+def test_get_sales_window():
+    tree = MarketTree()
+    root, exact, old, future, updated = uuid4(), uuid4(), uuid4(), uuid4(), uuid4()
+    now = DATE + timedelta(days=1)
+    add(tree, root, None, ShopUnitType.CATEGORY)
+    add(tree, exact, root, ShopUnitType.OFFER, 100, DATE)
+    add(tree, old, root, ShopUnitType.OFFER, 100, DATE - timedelta(seconds=1))
+    add(tree, future, root, ShopUnitType.OFFER, 100, now + timedelta(seconds=1))
+    add(tree, updated, root, ShopUnitType.OFFER, 100, DATE + timedelta(hours=1))
+    add(tree, updated, root, ShopUnitType.OFFER, 200, DATE + timedelta(hours=2))
+    add(tree, updated, root, ShopUnitType.OFFER, 300, now + timedelta(hours=1))
+
+    sales = {item["id"]: (item["price"], item["date"]) for item in tree.get_sales(now)["items"]}
+    assert sales == {exact: (100, DATE), updated: (200, DATE + timedelta(hours=2))}
+
+
+def test_get_statistic_bounds_are_inclusive():
+    tree = MarketTree()
+    root, offer = uuid4(), uuid4()
+    add(tree, root, None, ShopUnitType.CATEGORY)
+    for hours in range(4):
+        add(tree, offer, root, ShopUnitType.OFFER, 100 + hours, DATE + timedelta(hours=hours))
+
+    def prices(start_date=None, end_date=None):
+        return [item["price"] for item in tree.get_statistic_by_id(offer, start_date, end_date)["items"]]
+
+    assert prices() == [100, 101, 102, 103]
+    assert prices(DATE + timedelta(hours=1), DATE + timedelta(hours=2)) == [101, 102]
+    assert prices(DATE + timedelta(hours=1)) == [101, 102, 103]
+    assert prices(end_date=DATE + timedelta(hours=2)) == [100, 101, 102]
+    assert prices(DATE + timedelta(minutes=1), DATE + timedelta(minutes=59)) == []